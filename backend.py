@@ -0,0 +1,420 @@
+# backend.py — accès données / stockage / auth d'OphtaDossier, indépendant de Streamlit
+#
+# Deux implémentations de la même interface : SupabaseBackend (production) et LocalBackend
+# (SQLite + fichiers) pour travailler, mesurer et profiler hors ligne avec des volumes réalistes.
+from __future__ import annotations
+import hashlib, json, os, re, sqlite3, threading, time
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from pathlib import Path
+from collections import Counter, OrderedDict
+from types import SimpleNamespace
+from typing import Mapping
+
+# ────────────────────────── STOCKAGE LOCAL
+# Appels reçus par les stockages locaux, « table.op » ou « storage.méthode » (lu par bench.py)
+CALLS: Counter = Counter()
+
+_SQL_OPS = {"eq": "=", "neq": "!=", "gt": ">", "gte": ">=", "lt": "<", "lte": "<=", "ilike": "LIKE"}
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+class LocalQuery:
+    """Sous-ensemble de l'API fluide de postgrest-py, exécuté sur un LocalStore."""
+    def __init__(self, store: "LocalStore", table: str):
+        self.store, self.table = store, table
+        self.op, self.payload, self.cols, self.count = "select", None, "*", None
+        self.filters, self.orders, self.rng = [], [], None
+
+    def select(self, cols: str = "*", count: str|None = None):
+        self.cols, self.count = cols, count; return self
+    def insert(self, rows, **_):
+        self.op, self.payload = "insert", rows; return self
+    def upsert(self, rows, **_):
+        self.op, self.payload = "upsert", rows; return self
+    def update(self, fields: dict):
+        self.op, self.payload = "update", fields; return self
+    def delete(self):
+        self.op = "delete"; return self
+
+    def _f(self, m: str, col: str, val):
+        if not re.fullmatch(r"[a-z_]+", col): raise ValueError(f"colonne invalide : {col}")
+        self.filters.append((m, col, val)); return self
+    def eq(self, c, v):    return self._f("eq", c, v)
+    def neq(self, c, v):   return self._f("neq", c, v)
+    def gt(self, c, v):    return self._f("gt", c, v)
+    def gte(self, c, v):   return self._f("gte", c, v)
+    def lt(self, c, v):    return self._f("lt", c, v)
+    def lte(self, c, v):   return self._f("lte", c, v)
+    def ilike(self, c, v): return self._f("ilike", c, v)
+    def in_(self, c, v):   return self._f("in_", c, list(v))
+    # Chaîne JSON comme avec postgrest-py (une liste d'objets n'y est pas sérialisable)
+    def contains(self, c, v): return self._f("contains", c, json.loads(v) if isinstance(v, str) else list(v))
+
+    def order(self, col: str, desc: bool = False):
+        self.orders.append((col, desc)); return self
+    def range(self, a: int, b: int):
+        self.rng = (a, b); return self
+    def limit(self, n: int):
+        self.rng = (0, n - 1); return self
+
+    def execute(self):
+        return self.store.execute(self)
+
+class LocalStore:
+    """Lignes JSON dans SQLite (une base par owner), filtrées via json_extract.
+
+    Avec outbox=True, chaque écriture est aussi consignée pour être rejouée sur Supabase.
+    """
+    def __init__(self, path: Path, outbox: bool = False, on_write=None):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.outbox, self.on_write = outbox, on_write
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self.conn.executescript("""
+            PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS rows(tbl TEXT, id TEXT, data TEXT NOT NULL, PRIMARY KEY(tbl, id));
+            CREATE INDEX IF NOT EXISTS rows_owner ON rows(tbl, json_extract(data, '$.owner'));
+            CREATE INDEX IF NOT EXISTS rows_pid   ON rows(tbl, json_extract(data, '$.patient_id'));
+            CREATE INDEX IF NOT EXISTS rows_ctime ON rows(tbl, json_extract(data, '$.created_at'));
+            CREATE TABLE IF NOT EXISTS meta(tbl TEXT PRIMARY KEY, watermark TEXT, reconciled REAL DEFAULT 0);
+            CREATE TABLE IF NOT EXISTS outbox(seq INTEGER PRIMARY KEY AUTOINCREMENT, tbl TEXT, op TEXT,
+                filters TEXT, payload TEXT, tries INTEGER DEFAULT 0, error TEXT);
+        """)
+
+    def table(self, name: str) -> LocalQuery:
+        return LocalQuery(self, name)
+
+    def sql(self, sql: str, args=()) -> list:
+        # Accès direct (méta, outbox) ; la connexion est partagée entre threads, d'où le verrou
+        with self._lock:
+            return self.conn.execute(sql, args).fetchall()
+
+    def put_rows(self, table: str, rows: list[dict]):
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try: self._put(table, rows); self.conn.execute("COMMIT")
+            except Exception: self.conn.execute("ROLLBACK"); raise
+
+    def _where(self, q: LocalQuery) -> tuple[str, list]:
+        sql, args = ["tbl = ?"], [q.table]
+        for m, col, val in q.filters:
+            x = f"json_extract(data, '$.{col}')"
+            if m == "in_":
+                sql.append(f"{x} IN ({','.join('?' * len(val))})" if val else "0"); args += val
+            elif m == "contains":
+                # Tableau JSON contenant chaque élément (objet : sous-ensemble de champs), comme cs. de PostgREST
+                for e in val:
+                    fields = e.items() if isinstance(e, dict) else [(None, e)]
+                    if not all(k is None or re.fullmatch(r"[a-z_]+", k) for k, _ in fields): raise ValueError(f"champ invalide : {e}")
+                    conds = " AND ".join("j.value = ?" if k is None else f"json_extract(j.value, '$.{k}') = ?" for k, _ in fields)
+                    sql.append(f"EXISTS (SELECT 1 FROM json_each(data, '$.{col}') j WHERE {conds})"); args += [v for _, v in fields]
+            else:
+                sql.append(f"{x} {_SQL_OPS[m]} ?"); args.append(val)
+        return " AND ".join(sql), args
+
+    def execute(self, q: LocalQuery):
+        CALLS[f"{q.table}.{q.op}"] += 1
+        with self._lock:
+            if q.op == "select": return self._select(q)
+            self.conn.execute("BEGIN")
+            try:
+                res = getattr(self, f"_{q.op}")(q)
+                if self.outbox:
+                    self.conn.execute("INSERT INTO outbox(tbl, op, filters, payload) VALUES (?,?,?,?)",
+                                      (q.table, q.op, json.dumps(q.filters), json.dumps(q.payload)))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK"); raise
+        if self.on_write: self.on_write()
+        return res
+
+    def _select(self, q: LocalQuery):
+        where, args = self._where(q)
+        order = ", ".join(f"json_extract(data, '$.{c}') IS NULL{' DESC' if d else ''}, json_extract(data, '$.{c}'){' DESC' if d else ''}"
+                          for c, d in q.orders if re.fullmatch(r"[a-z_]+", c))
+        sql = f"SELECT data FROM rows WHERE {where}" + (f" ORDER BY {order}" if order else "")
+        if q.rng: sql += f" LIMIT {int(q.rng[1] - q.rng[0] + 1)} OFFSET {int(q.rng[0])}"
+        data = [json.loads(d) for (d,) in self.conn.execute(sql, args)]
+        if q.cols.strip() != "*":
+            cols = [c.strip() for c in q.cols.split(",")]
+            data = [{c: r.get(c) for c in cols} for r in data]
+        count = self.conn.execute(f"SELECT COUNT(*) FROM rows WHERE {where}", args).fetchone()[0] if q.count else None
+        return SimpleNamespace(data=data, count=count)
+
+    def _put(self, table: str, rows: list[dict]):
+        self.conn.executemany("INSERT OR REPLACE INTO rows(tbl, id, data) VALUES (?,?,?)",
+                              [(table, r["id"], json.dumps(r, ensure_ascii=False)) for r in rows])
+
+    def _insert(self, q: LocalQuery, merge: bool = False):
+        now, rows = _now_iso(), q.payload if isinstance(q.payload, list) else [q.payload]
+        out = []
+        for r in rows:
+            old = self.conn.execute("SELECT data FROM rows WHERE tbl=? AND id=?", (q.table, r["id"])).fetchone()
+            if old and not merge: raise sqlite3.IntegrityError(f"duplicate key {q.table}.{r['id']}")
+            out.append({**(json.loads(old[0]) if old else {"created_at": now}), **r, "updated_at": now})
+        self._put(q.table, out)
+        return SimpleNamespace(data=out, count=None)
+
+    def _upsert(self, q: LocalQuery):
+        return self._insert(q, merge=True)
+
+    def _update(self, q: LocalQuery):
+        where, args = self._where(q)
+        now = _now_iso()
+        out = [{**json.loads(d), **q.payload, "updated_at": now}
+               for (d,) in self.conn.execute(f"SELECT data FROM rows WHERE {where}", args)]
+        self._put(q.table, out)
+        return SimpleNamespace(data=out, count=None)
+
+    def _delete(self, q: LocalQuery):
+        where, args = self._where(q)
+        out = [json.loads(d) for (d,) in self.conn.execute(f"SELECT data FROM rows WHERE {where}", args)]
+        self.conn.execute(f"DELETE FROM rows WHERE {where}", args)
+        return SimpleNamespace(data=out, count=None)
+
+class LocalBucket:
+    """Remplaçant fichier local du bucket Supabase (sous-ensemble de storage.from_() utilisé ici)."""
+    def __init__(self, root: str):
+        self.root = Path(root).resolve()
+
+    def _path(self, key: str) -> Path:
+        p = (self.root / key).resolve()
+        if self.root not in p.parents: raise ValueError(f"clé hors du bucket : {key}")
+        return p
+
+    def upload(self, key: str, raw: bytes, opts: dict|None = None):
+        CALLS["storage.upload"] += 1
+        p = self._path(key)
+        if p.exists() and str((opts or {}).get("upsert", "")).lower() != "true":
+            raise FileExistsError(f"Duplicate : {key}")
+        p.parent.mkdir(parents=True, exist_ok=True); p.write_bytes(raw)
+
+    def remove(self, keys: list[str]) -> list:
+        CALLS["storage.remove"] += 1
+        for k in keys: self._path(k).unlink(missing_ok=True)
+        return []
+
+    def list(self, path: str = "", options: dict|None = None) -> list[dict]:
+        # Comme storage.list : fichiers directs du dossier, filtre « search » sur le préfixe du nom, pagination limit/offset
+        CALLS["storage.list"] += 1
+        o = options or {}
+        d = self._path(path) if path else self.root
+        files = sorted(p for p in d.iterdir() if p.is_file() and p.name.startswith(o.get("search", ""))) if d.is_dir() else []
+        off = int(o.get("offset", 0))
+        return [{"name": p.name, "id": p.name, "metadata": {"size": (stat := p.stat()).st_size},
+                 "created_at": datetime.fromtimestamp(stat.st_mtime, timezone.utc).isoformat()}
+                for p in files[off:off + int(o.get("limit", 100))]]
+
+    def download(self, key: str) -> bytes:
+        CALLS["storage.download"] += 1
+        return self._path(key).read_bytes()
+
+    # st.image accepte un chemin local : l'« URL signée » est le chemin du fichier
+    def create_signed_url(self, key: str, ttl: int) -> dict:
+        # Objet absent : refus comme Storage (404), pas une erreur d'E/S
+        CALLS["storage.sign"] += 1
+        if not (p := self._path(key)).exists(): raise LookupError(f"Object not found : {key}")
+        return {"signedURL": str(p)}
+
+    def create_signed_urls(self, keys: list[str], ttl: int) -> list[dict]:
+        CALLS["storage.sign"] += 1
+        return [{"path": k, "signedURL": str(self._path(k)),
+                 "error": None if self._path(k).exists() else "not found"} for k in keys]
+
+
+# ────────────────────────── INTERFACE
+class Backend(ABC):
+    """Ce dont l'app a besoin : tables (API fluide postgrest-py), bucket de photos et auth.
+
+    table, bucket et sign_in sont abstraits : une implémentation incomplète échoue à sa création,
+    pas au premier appel.
+    """
+    is_local = False
+
+    @abstractmethod
+    def table(self, name: str): ...
+
+    @abstractmethod
+    def bucket(self): ...
+
+    def current_user(self) -> dict|None:
+        return None
+
+    @abstractmethod
+    def sign_in(self, email: str, password: str) -> dict: ...
+
+    def sign_out(self):
+        pass
+
+    def session(self, sid: str) -> "Backend":
+        # Vue propre à une session Streamlit (client authentifié distinct) ; par défaut le backend lui-même
+        return self
+
+    def signed_in(self) -> bool:
+        return True
+
+class ClientPool:
+    """Clients Supabase authentifiés, un par session : chaque session garde ses connexions HTTP
+    (keep-alive) et son jeton au lieu de se relayer sur un client partagé.
+
+    Au plus `size` clients ; le moins récemment utilisé est évincé au-delà, comme ceux inactifs
+    depuis `idle` s. Les jetons (tenus à jour à chaque rafraîchissement) survivent à l'éviction :
+    le client est recréé à la demande et sa session restaurée, rafraîchie si elle a expiré.
+    """
+    KEEP = 7 * 24 * 3600  # s : jetons d'une session disparue oubliés au-delà
+
+    def __init__(self, factory, size: int = 32, idle: float = 1800):
+        self.factory, self.size, self.idle = factory, size, idle
+        self._clients: OrderedDict = OrderedDict()   # sid → [client, dernier accès], du moins récent au plus récent
+        self.tokens: dict[str, tuple] = {}           # sid → (access_token, refresh_token)
+        self._seen: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.created = self.evicted = 0
+
+    def get(self, sid: str):
+        now = time.time()
+        with self._lock:
+            self._seen[sid] = now
+            hit = self._clients.get(sid)
+            if hit:
+                hit[1] = now; self._clients.move_to_end(sid); self._evict(now)
+                return hit[0]
+            tokens = self.tokens.get(sid)
+        c = self.factory()  # hors verrou : la restauration peut appeler l'API auth
+        c.auth.on_auth_state_change(lambda event, s: self._remember(sid, s))
+        if tokens:
+            try: c.auth.set_session(*tokens)
+            except Exception: self.tokens.pop(sid, None)  # jeton révoqué : reconnexion demandée
+        with self._lock:
+            if sid in self._clients: return self._clients[sid][0]  # créé entre-temps par un autre thread
+            self._clients[sid] = [c, now]; self.created += 1
+            self._evict(now)
+        return c
+
+    def _remember(self, sid: str, session):
+        if session: self.tokens[sid] = (session.access_token, session.refresh_token)
+
+    def drop(self, sid: str):
+        with self._lock:
+            hit = self._clients.pop(sid, None)
+            self.tokens.pop(sid, None); self._seen.pop(sid, None)
+        if hit: self._close(hit[0])
+
+    def _evict(self, now: float):
+        while self._clients and (len(self._clients) > self.size or now - next(iter(self._clients.values()))[1] > self.idle):
+            _, (c, _) = self._clients.popitem(last=False); self.evicted += 1
+            self._close(c)
+        for sid in [k for k, t in self._seen.items() if now - t > self.KEEP]:
+            self._seen.pop(sid, None); self.tokens.pop(sid, None)
+
+    @staticmethod
+    def _close(c):
+        # Arrête le rafraîchissement automatique (minuterie) et ferme les connexions gardées ouvertes
+        for close in (lambda: c.auth._remove_session(), lambda: c._postgrest and c._postgrest.session.close(),
+                      lambda: c._storage and c._storage.session.close()):
+            try: close()
+            except Exception: pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"clients": len(self._clients), "size": self.size, "created": self.created, "evicted": self.evicted}
+
+class SupabaseBackend(Backend):
+    def __init__(self, url: str, key: str, bucket: str, pool_size: int = 32, pool_idle: float = 1800):
+        self.url, self.key, self.bucket_name = url, key, bucket
+        self.client = self._new_client()  # anonyme : rien de propre à une session
+        self.pool = ClientPool(self._new_client, pool_size, pool_idle)
+
+    def _new_client(self):
+        from supabase import create_client
+        return create_client(self.url, self.key)
+
+    def session(self, sid: str) -> "SupabaseSession":
+        return SupabaseSession(self, sid)
+
+    def table(self, name: str):
+        return self.client.table(name)
+
+    def bucket(self):
+        return self.client.storage.from_(self.bucket_name)
+
+    def sign_in(self, email: str, password: str) -> dict:
+        # Client partagé entre sessions : jamais authentifié, la connexion passe par session(sid)
+        raise RuntimeError("sign_in sur le backend partagé : utiliser session(sid).sign_in")
+
+class SupabaseSession(Backend):
+    """Le backend vu d'une session : son propre client du pool, authentifié par sign_in."""
+    def __init__(self, be: SupabaseBackend, sid: str):
+        self.be, self.sid, self.pool = be, sid, be.pool
+
+    @property
+    def client(self):
+        return self.pool.get(self.sid)
+
+    def table(self, name: str):
+        return self.client.table(name)
+
+    def bucket(self):
+        return self.client.storage.from_(self.be.bucket_name)
+
+    def signed_in(self) -> bool:
+        # Jeton présent (rafraîchi s'il expire bientôt) ; faux après éviction d'une session révoquée
+        try: return self.client.auth.get_session() is not None
+        except Exception: return False
+
+    def current_user(self) -> dict|None:
+        if not self.signed_in(): return None
+        got = self.client.auth.get_user()
+        return {"id": got.user.id, "email": got.user.email} if got and got.user else None
+
+    def sign_in(self, email: str, password: str) -> dict:
+        res = self.client.auth.sign_in_with_password({"email": email, "password": password})
+        return {"id": res.user.id, "email": res.user.email}
+
+    def sign_out(self):
+        try: self.client.auth.sign_out()
+        finally: self.pool.drop(self.sid)
+
+class LocalBackend(Backend):
+    """Tout sous un répertoire : data.sqlite (toutes les tables, filtrées par owner) + bucket/.
+
+    Pas de vraie authentification : l'id utilisateur est dérivé de l'e-mail ; si LOCAL_PASSWORD
+    est défini, il est exigé.
+    """
+    is_local = True
+
+    def __init__(self, root: str|Path, password: str|None = None):
+        self.root, self.password = Path(root), password
+        self.store = LocalStore(self.root / "data.sqlite")
+        self._bucket = LocalBucket(self.root / "bucket")
+
+    def table(self, name: str) -> LocalQuery:
+        return self.store.table(name)
+
+    def bucket(self) -> LocalBucket:
+        return self._bucket
+
+    @staticmethod
+    def user_id(email: str) -> str:
+        return "local-" + hashlib.sha1(email.strip().lower().encode()).hexdigest()[:12]
+
+    def sign_in(self, email: str, password: str) -> dict:
+        if not email or (self.password and password != self.password):
+            raise ValueError("identifiants invalides")
+        return {"id": self.user_id(email), "email": email.strip()}
+
+def make_backend(cfg: Mapping) -> Backend:
+    """BACKEND = "supabase" (défaut) ou "local", lu dans cfg (secrets) puis dans l'environnement."""
+    get = lambda k, d=None: cfg.get(k) or os.environ.get(k) or d
+    kind = get("BACKEND", "supabase").lower()
+    if kind == "local":
+        return LocalBackend(get("LOCAL_DIR", ".ophtatrack/local"), get("LOCAL_PASSWORD"))
+    if kind != "supabase":
+        raise ValueError(f"BACKEND inconnu : {kind}")
+    url, key = get("SUPABASE_URL"), get("SUPABASE_ANON_KEY")
+    if not (url and key):
+        raise RuntimeError("SUPABASE_URL et SUPABASE_ANON_KEY doivent être définis (secrets ou environnement).")
+    return SupabaseBackend(url, key, get("SUPABASE_BUCKET", "Ophtadossier"),
+                           int(get("POOL_SIZE", 32)), float(get("POOL_IDLE", 1800)))
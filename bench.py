@@ -0,0 +1,256 @@
+"""Banc d'essai : locataire synthétique + exécution headless de l'app via AppTest.
+
+    python bench.py --sizes 100,1000,10000 --out bench_results.json [--compare ancien.json]
+
+Les données sont générées de façon déterministe (graine) dans un LocalBackend (BACKEND=local) ;
+chaque taille est semée une seule fois sous --dir puis réutilisée. Pour chaque scénario :
+temps d'exécution du script à froid (caches vidés) et à chaud, appels au backend, pic mémoire
+(tracemalloc, exécution séparée) et nombre de widgets / éléments rendus.
+"""
+from __future__ import annotations
+import argparse, io, json, platform, random, subprocess, sys, time, tracemalloc
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+import streamlit as st
+from PIL import Image
+from streamlit.testing.v1 import AppTest
+
+import backend
+from backend import LocalBackend
+
+ROOT  = Path(__file__).resolve().parent
+APP   = ROOT / "app.py"
+EMAIL = "bench@ophtatrack.local"
+OWNER = LocalBackend.user_id(EMAIL)
+BATCH = 1000
+
+PATHOS = ["Glaucome", "Cataracte", "Rétinopathie diabétique", "DMLA", "Kératocône", "Uvéite",
+          "Décollement de rétine", "Strabisme", "Sécheresse oculaire", "Œdème maculaire"]
+NOMS   = ["Benali", "El Amrani", "Ouazzani", "Chraïbi", "Tazi", "Bennani", "Lahlou", "Idrissi",
+          "Alaoui", "Berrada", "Fassi", "Sebti", "Naciri", "Kettani", "Zniber", "Hajji"]
+PRENOMS= ["Fatima", "Mohamed", "Aïcha", "Youssef", "Khadija", "Omar", "Salma", "Hicham",
+          "Zineb", "Mehdi", "Nadia", "Rachid", "Hélène", "François", "Inès", "Saïd"]
+NOTES  = ["Contrôle PIO", "Fond d'œil normal", "Baisse d'acuité progressive", "Suivi post-op",
+          "Collyre à renouveler", "Œdème régressif", "Laser prévu", "RAS"]
+LIEUX  = ["Urgences", "Consultation", "Bloc"]
+NIVEAUX= ["Basse", "Moyenne", "Haute"]
+WIDGETS= {"button", "download_button", "form_submit_button", "text_input", "text_area", "number_input",
+          "date_input", "time_input", "radio", "checkbox", "toggle", "selectbox", "multiselect",
+          "slider", "select_slider", "file_uploader", "color_picker", "chat_input", "camera_input"}
+
+# ────────────────────────── DONNÉES
+def _photo_pool(rng: random.Random, n: int = 4, px: tuple[int, int] = (1600, 1200)) -> list[tuple[bytes, bytes]]:
+    # Bruit RVB : se compresse mal, donc des JPEG de taille réaliste (~1–2 Mo)
+    out = []
+    for _ in range(n):
+        bands = [Image.effect_noise(px, rng.randint(40, 90)) for _ in range(3)]
+        im = Image.merge("RGB", bands)
+        full = io.BytesIO(); im.save(full, "JPEG", quality=88)
+        im.thumbnail((480, 480))
+        th = io.BytesIO(); im.save(th, "WEBP", quality=75)
+        out.append((full.getvalue(), th.getvalue()))
+    return out
+
+def seed(root: Path, n: int, consults: int, seed_: int = 42) -> dict:
+    """Sème n patients, ~consults consultations/patient, des photos et des événements sur 5 ans.
+
+    Réutilise le répertoire si un semis identique y est déjà marqué (seed.json).
+    """
+    params = {"patients": n, "consults": consults, "seed": seed_, "owner": OWNER, "v": 2}
+    marker = root / "seed.json"
+    if marker.exists() and json.loads(marker.read_text()).get("params") == params:
+        return json.loads(marker.read_text())
+    if root.exists():
+        for p in sorted(root.rglob("*"), reverse=True): p.unlink() if p.is_file() else p.rmdir()
+    rng, be = random.Random(seed_), LocalBackend(root)
+    t0 = time.perf_counter()
+
+    pool = []
+    for i, (full, th) in enumerate(_photo_pool(rng)):
+        key = f"public/{OWNER}/bench_{i}.jpg"
+        be.bucket().upload(key, full); be.bucket().upload(key.rsplit(".", 1)[0] + ".thumb.webp", th)
+        pool.append({"key": key, "thumb": key.rsplit(".", 1)[0] + ".thumb.webp"})
+
+    today, epoch = date.today(), datetime.now(timezone.utc) - timedelta(days=5 * 365)
+    pats, cons, n_cons = [], [], 0
+    def flush(table: str, rows: list):
+        if rows: be.table(table).insert(rows).execute(); rows.clear()
+
+    for i in range(n):
+        pid = f"b{i:07d}"
+        d = today - timedelta(days=rng.randint(0, 5 * 365))
+        pats.append({
+            "id": pid, "owner": OWNER, "nom": f"{rng.choice(PRENOMS)} {rng.choice(NOMS)}",
+            "telephone": f"+2126{rng.randint(0, 99_999_999):08d}", "pathologie": rng.choice(PATHOS),
+            "note": rng.choice(NOTES), "date_consult": str(d),
+            "prochain_rdv": str(d + timedelta(days=rng.randint(7, 180))) if rng.random() < .4 else None,
+            "niveau": rng.choice(NIVEAUX), "tags": ",".join(rng.sample(["diabète", "HTA", "myopie", "enfant", "chirurgie"], 2)),
+            # created_at distincts et croissants : le keyset de page_list reste déterministe
+            "created_at": (epoch + timedelta(seconds=i * 97)).isoformat(),
+        })
+        for j in range(max(1, int(rng.gauss(consults, consults / 3 or 1)))):
+            cd = d - timedelta(days=30 * j + rng.randint(0, 20))
+            cons.append({
+                "id": f"{pid}c{j:02d}", "owner": OWNER, "patient_id": pid, "date_consult": str(cd),
+                "lieu": rng.choice(LIEUX), "pathologie": rng.choice(PATHOS), "note": rng.choice(NOTES) * rng.randint(1, 6),
+                "prochain_rdv": None, "photos": rng.sample(pool, rng.randint(1, 3)) if rng.random() < .3 else [],
+            })
+            n_cons += 1
+        if len(pats) >= BATCH: flush("patients", pats)
+        if len(cons) >= BATCH: flush("consultations", cons)
+    flush("patients", pats); flush("consultations", cons)
+
+    evs, n_ev = [], max(20, n // 2)
+    for k in range(n_ev):
+        sd = today - timedelta(days=4 * 365) + timedelta(days=rng.randint(0, 5 * 365))
+        multi = rng.random() < .15
+        evs.append({
+            "id": f"e{k:07d}", "owner": OWNER, "title": f"Contrôle {rng.choice(PATHOS).lower()}",
+            "start_date": str(sd), "end_date": str(sd + timedelta(days=rng.randint(1, 5))) if multi else None,
+            "all_day": True, "notes": rng.choice(NOTES), "patient_id": f"b{rng.randrange(n):07d}" if rng.random() < .6 else None,
+            "recurrence": rng.choice(["m:3", "m:6", "s:2", "a:1"]) if rng.random() < .05 else "",
+        })
+        if len(evs) >= BATCH: flush("events", evs)
+    flush("events", evs)
+
+    info = {"params": params, "consultations": n_cons, "events": n_ev, "photos": len(pool),
+            "seed_s": round(time.perf_counter() - t0, 2)}
+    marker.write_text(json.dumps(info))
+    return info
+
+# ────────────────────────── SCÉNARIOS
+def _newest(root: Path, k: int) -> list[str]:
+    rows = (LocalBackend(root).table("patients").select("id").eq("owner", OWNER)
+            .order("created_at", desc=True).limit(k).execute().data)
+    return [r["id"] for r in rows]
+
+def _search(at: AppTest):
+    next(w for w in at.text_input if w.label.startswith("Recherche")).input("glaucome benali")
+
+def _export(fmt: str):
+    def go(at: AppTest):
+        next(w for w in at.radio if w.label == "Format").set_value(fmt)
+        next(b for b in at.button if "Générer" in b.label).click()
+    return go
+
+# nom → (page, état initial, action) ; l'action éventuelle est mesurée après une première exécution
+SCENARIOS = {
+    "add":         ("add",    None, None),
+    "list":        ("list",   None, None),
+    "list_open":   ("list",   lambda root: {f"open_{p}": True for p in _newest(root, 5)}, None),
+    "list_search": ("list",   None, _search),
+    "agenda":      ("agenda", None, None),
+    "stats":       ("stats",  None, None),
+    "export":      ("export", None, None),
+    "export_csv":  ("export", None, _export("CSV")),
+    "export_xlsx": ("export", None, _export("XLSX")),
+}
+
+def _count(at: AppTest) -> tuple[int, int]:
+    c = Counter()
+    def walk(node):
+        t = getattr(node, "type", "")
+        c["widgets" if t in WIDGETS else "elements"] += not getattr(node, "children", None)
+        for ch in (getattr(node, "children", None) or {}).values(): walk(ch)
+    walk(at._tree)
+    return c["widgets"], c["elements"]
+
+def _app(root: Path, page: str, state: dict, timeout: int) -> AppTest:
+    at = AppTest.from_file(str(APP), default_timeout=timeout)
+    at.secrets["BACKEND"], at.secrets["LOCAL_DIR"] = "local", str(root)
+    at.session_state["user"] = {"id": OWNER, "email": EMAIL}
+    at.session_state["page"] = page
+    for k, v in state.items(): at.session_state[k] = v
+    return at
+
+def _timed(at: AppTest) -> tuple[float, dict]:
+    before = Counter(backend.CALLS)
+    t = time.perf_counter(); at.run(); dt = time.perf_counter() - t
+    if at.exception: raise RuntimeError(at.exception[0].value)
+    return dt, dict(Counter(backend.CALLS) - before)
+
+def run_scenario(root: Path, name: str, timeout: int = 600) -> dict:
+    page, init, action = SCENARIOS[name]
+    state = init(root) if init else {}
+
+    def cold() -> AppTest:
+        st.cache_resource.clear(); st.cache_data.clear()
+        at = _app(root, page, state, timeout)
+        if action: at.run(); action(at)
+        return at
+
+    at = cold()
+    cold_s, calls = _timed(at)
+    widgets, elements = _count(at)
+    warm_s, warm_calls = _timed(at)
+
+    tracemalloc.start()
+    try:
+        at = cold(); tracemalloc.reset_peak(); at.run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"cold_s": round(cold_s, 4), "warm_s": round(warm_s, 4),
+            "calls": sum(calls.values()), "warm_calls": sum(warm_calls.values()), "calls_by_op": calls,
+            "peak_mb": round(peak / 2**20, 2), "widgets": widgets, "elements": elements}
+
+# ────────────────────────── RÉSULTATS
+def _meta() -> dict:
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        rev = ""
+    return {"git": rev, "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(), "streamlit": st.__version__, "platform": platform.platform()}
+
+def compare(old: dict, new: dict, tol: float = .2) -> list[str]:
+    """Régressions de new par rapport à old : temps/mémoire > +tol, appels au backend en hausse."""
+    out = []
+    for size, scen in new["results"].items():
+        for name, r in scen.items():
+            o = old.get("results", {}).get(size, {}).get(name)
+            if not o: continue
+            for k in ("cold_s", "warm_s", "peak_mb"):
+                # Seuil absolu : les mesures de quelques ms sont trop bruitées pour un ratio
+                if o[k] and r[k] > o[k] * (1 + tol) and r[k] - o[k] > .05:
+                    out.append(f"{size} {name} {k}: {o[k]} → {r[k]} (+{(r[k] / o[k] - 1) * 100:.0f} %)")
+            for k in ("calls", "warm_calls", "widgets"):
+                if r[k] > o[k]: out.append(f"{size} {name} {k}: {o[k]} → {r[k]}")
+    return out
+
+def main(argv: list[str]|None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--sizes", default="100,1000,10000", help="nombres de patients, séparés par des virgules")
+    ap.add_argument("--consults", type=int, default=3, help="consultations moyennes par patient")
+    ap.add_argument("--scenarios", default=",".join(SCENARIOS))
+    ap.add_argument("--dir", default=str(ROOT / ".bench"), help="répertoire des locataires semés")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--out", default="bench_results.json")
+    ap.add_argument("--compare", help="résultats précédents (JSON) à comparer")
+    ap.add_argument("--tolerance", type=float, default=.2)
+    a = ap.parse_args(argv)
+
+    report = {"meta": {**_meta(), "consults": a.consults, "seed": a.seed}, "seeds": {}, "results": {}}
+    for n in (int(s) for s in a.sizes.split(",") if s):
+        root = Path(a.dir) / f"n{n}_c{a.consults}_s{a.seed}"
+        report["seeds"][n] = seed(root, n, a.consults, a.seed)
+        report["results"][n] = {}
+        run_scenario(root, "add")  # premier AppTest du process : imports et compilation hors mesure
+        for name in a.scenarios.split(","):
+            r = report["results"][n][name] = run_scenario(root, name)
+            print(f"{n:>6} {name:<12} froid {r['cold_s']:>7.3f}s  chaud {r['warm_s']:>7.3f}s  "
+                  f"appels {r['calls']:>4}/{r['warm_calls']:<4} pic {r['peak_mb']:>7.1f} Mo  widgets {r['widgets']}", flush=True)
+
+    # Clés JSON : les tailles deviennent des chaînes, comme dans un fichier relu
+    report = json.loads(json.dumps(report))
+    Path(a.out).write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    if a.compare:
+        regs = compare(json.loads(Path(a.compare).read_text()), report, a.tolerance)
+        for line in regs: print("RÉGRESSION", line)
+        return 1 if regs else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+"""Instrumentation : traces par exécution du script, compteurs cumulés du process, profileur.
+
+Sans Streamlit : l'exécution courante est portée par une ContextVar (un thread de script par
+session) ; les workers la reçoivent via bind(). Tant qu'aucune exécution n'est ouverte,
+les wrappers ne font que déléguer.
+"""
+from __future__ import annotations
+import contextvars, json, sys, threading, time
+from collections import Counter, defaultdict, deque
+from pathlib import Path
+
+_RUN: contextvars.ContextVar = contextvars.ContextVar("ophtatrack_run", default=None)
+_VERBS = {"select", "insert", "upsert", "update", "delete"}
+
+# ────────────────────────── TRACES
+class RunTrace:
+    """Appels backend et accès aux getters en cache pendant une exécution du script."""
+    def __init__(self, page: str = ""):
+        self.page, self.started, self.seconds = page, time.time(), 0.0
+        self.calls: list[dict] = []
+        self.cache: Counter = Counter()   # (getter, "hit"|"miss") → n
+        self.profile: list[tuple] = []
+        self._lock = threading.Lock()
+
+    def add(self, **call):
+        with self._lock: self.calls.append(call)
+
+    def summary(self) -> dict:
+        agg = defaultdict(lambda: {"n": 0, "seconds": 0.0, "rows": 0, "bytes": 0, "errors": 0})
+        for c in self.calls:
+            a = agg[f"{c['kind']}:{c['name']}.{c['op']}"]
+            a["n"] += 1; a["seconds"] += c["seconds"]; a["rows"] += c["rows"]; a["bytes"] += c["bytes"]; a["errors"] += bool(c["error"])
+        return dict(sorted(agg.items(), key=lambda kv: -kv[1]["seconds"]))
+
+    def as_dict(self) -> dict:
+        return {"ts": round(self.started, 3), "page": self.page, "seconds": round(self.seconds, 4),
+                "calls": self.calls, "cache": [{"getter": g, "result": r, "n": n} for (g, r), n in self.cache.items()],
+                "profile": self.profile}
+
+def current() -> RunTrace|None:
+    return _RUN.get()
+
+def begin(page: str = "") -> RunTrace:
+    tr = RunTrace(page); _RUN.set(tr); return tr
+
+def end(tr: RunTrace):
+    """Clôt l'exécution : durée, cumul dans METRICS, historique et journal JSONL éventuel."""
+    tr.seconds = time.time() - tr.started
+    _RUN.set(None)
+    METRICS.absorb(tr)
+
+def bind(fn):
+    # Pour ThreadPoolExecutor : le worker écrit dans la trace de l'exécution qui l'a lancé
+    # (une copie du contexte par appel : un même Context ne peut être entré par deux threads)
+    ctx = contextvars.copy_context()
+    return lambda *a, **kw: ctx.copy().run(fn, *a, **kw)
+
+def _size(data) -> int:
+    if data is None: return 0
+    if isinstance(data, (bytes, bytearray)): return len(data)
+    return len(json.dumps(data, default=str, ensure_ascii=False).encode())
+
+def _record(kind: str, name: str, op: str, t0: float, rows: int = 0, nbytes: int = 0, error: str|None = None):
+    tr = _RUN.get()
+    if tr is not None:
+        tr.add(kind=kind, name=name, op=op, seconds=round(time.perf_counter() - t0, 6), rows=rows, bytes=nbytes, error=error)
+
+def cache_access(getter: str, hit: bool):
+    tr = _RUN.get()
+    if tr is not None:
+        with tr._lock: tr.cache[(getter, "hit" if hit else "miss")] += 1
+
+# ────────────────────────── WRAPPERS
+class TracedQuery:
+    """Builder postgrest (ou LocalQuery) dont les appels chaînés restent tracés ; execute() est mesuré."""
+    __slots__ = ("_q", "_name", "_op", "_kind")
+
+    def __init__(self, q, name: str, op: str = "select", kind: str = "table"):
+        self._q, self._name, self._op, self._kind = q, name, op, kind
+
+    def __getattr__(self, attr):
+        if attr == "execute": return self._execute
+        v = getattr(self._q, attr)
+        if not callable(v): return v
+        def call(*a, **kw):
+            r = v(*a, **kw)
+            if not hasattr(r, "execute"): return r
+            return TracedQuery(r, self._name, attr if attr in _VERBS else self._op, self._kind)
+        return call
+
+    def _execute(self):
+        if _RUN.get() is None: return self._q.execute()
+        t0 = time.perf_counter()
+        try:
+            res = self._q.execute()
+        except Exception as e:
+            _record(self._kind, self._name, self._op, t0, error=type(e).__name__); raise
+        data = getattr(res, "data", None)
+        _record(self._kind, self._name, self._op, t0, len(data) if isinstance(data, list) else int(bool(data)), _size(data))
+        return res
+
+class TracedBucket:
+    """Bucket de stockage : chaque méthode appelée est mesurée (octets envoyés ou reçus)."""
+    __slots__ = ("_b",)
+
+    def __init__(self, b):
+        self._b = b
+
+    def __getattr__(self, attr):
+        v = getattr(self._b, attr)
+        if not callable(v): return v
+        def call(*a, **kw):
+            if _RUN.get() is None: return v(*a, **kw)
+            t0 = time.perf_counter()
+            try:
+                r = v(*a, **kw)
+            except Exception as e:
+                _record("storage", "bucket", attr, t0, error=type(e).__name__); raise
+            sent = sum(len(x) for x in a if isinstance(x, (bytes, bytearray)))
+            got = len(r) if isinstance(r, (bytes, bytearray)) else 0
+            _record("storage", "bucket", attr, t0, len(r) if isinstance(r, list) else 1, sent + got)
+            return r
+        return call
+
+class Traced:
+    """Source de tables / bucket (backend, miroir) dont les requêtes sont tracées sous `kind`."""
+    def __init__(self, src, kind: str = "table"):
+        self.src, self.kind = src, kind
+
+    def table(self, name: str) -> TracedQuery:
+        return TracedQuery(self.src.table(name), name, kind=self.kind)
+
+    def bucket(self) -> TracedBucket:
+        return TracedBucket(self.src.bucket())
+
+    def __getattr__(self, attr):
+        return getattr(self.src, attr)
+
+# ────────────────────────── PROFILEUR
+class Sampler:
+    """Profileur par échantillonnage du thread appelant : toutes les `every` s, relève sa pile.
+
+    Seuls les cadres des fichiers de `roots` comptent ; top() donne, par fonction, les
+    échantillons où elle est sur la pile (inclusif) et ceux où elle est le cadre le plus profond (propre).
+    """
+    def __init__(self, roots: tuple[str, ...], every: float = 0.005):
+        self.roots, self.every = tuple(str(Path(r).resolve()) for r in roots), every
+        self.total, self.incl, self.own = 0, Counter(), Counter()
+        self._stop, self._tid, self._t = threading.Event(), None, None
+
+    def __enter__(self):
+        self._tid = threading.get_ident()
+        self._t = threading.Thread(target=self._loop, name="ophtatrack-sampler", daemon=True); self._t.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set(); self._t.join()
+
+    def _loop(self):
+        while not self._stop.wait(self.every):
+            f = sys._current_frames().get(self._tid)
+            names = []
+            while f is not None:
+                if f.f_code.co_filename.startswith(self.roots): names.append(f.f_code.co_name)
+                f = f.f_back
+            self.total += 1
+            if names:
+                self.own[names[0]] += 1
+                for n in set(names): self.incl[n] += 1
+
+    def top(self, n: int = 15) -> list[tuple]:
+        """[(fonction, échantillons inclusifs, propres, part inclusive)]"""
+        return [(fn, k, self.own[fn], round(k / self.total, 3)) for fn, k in self.incl.most_common(n)] if self.total else []
+
+# ────────────────────────── CUMULS DU PROCESS
+def _labels(labels: dict) -> str:
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return ",".join(f'{k}="{esc(v)}"' for k, v in labels.items())
+
+class Metrics:
+    """Compteurs cumulés depuis le démarrage et dernières exécutions (export Prometheus / JSONL)."""
+    def __init__(self, history: int = 200):
+        self.calls = defaultdict(lambda: [0, 0.0, 0, 0, 0])   # (kind, name, op) → n, s, rows, bytes, erreurs
+        self.cache: Counter = Counter()                        # (getter, résultat) → n
+        self.runs = defaultdict(lambda: [0, 0.0])              # page → n, s
+        self.history: deque = deque(maxlen=history)
+        self.log_path: Path|None = None
+        self._lock = threading.Lock()
+
+    def absorb(self, tr: RunTrace):
+        with self._lock:
+            for c in tr.calls:
+                m = self.calls[(c["kind"], c["name"], c["op"])]
+                m[0] += 1; m[1] += c["seconds"]; m[2] += c["rows"]; m[3] += c["bytes"]; m[4] += bool(c["error"])
+            self.cache.update(tr.cache)
+            r = self.runs[tr.page]; r[0] += 1; r[1] += tr.seconds
+            self.history.append(tr)
+            if self.log_path:
+                with open(self.log_path, "a", encoding="utf-8") as f: f.write(json.dumps(tr.as_dict(), ensure_ascii=False) + "\n")
+
+    def prometheus(self) -> str:
+        out = []
+        def family(name: str, kind: str, help_: str, samples):
+            out.extend([f"# HELP {name} {help_}", f"# TYPE {name} {kind}"])
+            out.extend(f"{name}{{{_labels(labels)}}} {val}" for labels, val in samples)
+        with self._lock:
+            calls = [({"kind": k, "name": n, "op": o}, m) for (k, n, o), m in sorted(self.calls.items())]
+            family("ophtatrack_backend_calls_total", "counter", "Appels backend (tables, stockage).", [(l, m[0]) for l, m in calls])
+            family("ophtatrack_backend_seconds_total", "counter", "Temps passé dans les appels backend.", [(l, round(m[1], 6)) for l, m in calls])
+            family("ophtatrack_backend_rows_total", "counter", "Lignes ou objets renvoyés.", [(l, m[2]) for l, m in calls])
+            family("ophtatrack_backend_bytes_total", "counter", "Octets de charge utile (JSON ou fichiers).", [(l, m[3]) for l, m in calls])
+            family("ophtatrack_backend_errors_total", "counter", "Appels backend en erreur.", [(l, m[4]) for l, m in calls])
+            family("ophtatrack_cache_requests_total", "counter", "Accès aux getters en cache.",
+                   [({"getter": g, "result": r}, n) for (g, r), n in sorted(self.cache.items())])
+            runs = sorted(self.runs.items())
+            family("ophtatrack_script_runs_total", "counter", "Exécutions du script par page.", [({"page": p}, r[0]) for p, r in runs])
+            family("ophtatrack_script_seconds_total", "counter", "Durée cumulée des exécutions par page.", [({"page": p}, round(r[1], 6)) for p, r in runs])
+        return "\n".join(out) + "\n"
+
+    def jsonl(self) -> str:
+        with self._lock: runs = list(self.history)
+        return "".join(json.dumps(tr.as_dict(), ensure_ascii=False) + "\n" for tr in runs)
+
+METRICS = Metrics()
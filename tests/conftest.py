@@ -0,0 +1,19 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+@pytest.fixture(scope="session")
+def app(tmp_path_factory):
+    """Espace de noms de app.py exécuté une fois hors serveur, sur un backend local (aucun réseau)."""
+    os.environ.update(BACKEND="local", LOCAL_DIR=str(tmp_path_factory.mktemp("local")))
+    import streamlit as st
+    st.session_state["user"] = {"id": "owner-test", "email": "test@example.org"}
+    st.session_state["page"] = "add"
+    ns = {"__file__": str(ROOT / "app.py"), "__name__": "__main__"}
+    exec(compile((ROOT / "app.py").read_text(encoding="utf-8"), ns["__file__"], "exec"), ns)
+    return ns
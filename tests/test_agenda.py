@@ -0,0 +1,25 @@
+from datetime import date
+
+def occ(app, ws, we, **e):
+    return list(app["occurrences"]({"id": "e1", "start_date": "2025-01-31", **e}, ws, we))
+
+def test_single_event_overlapping_window(app):
+    assert occ(app, date(2025, 2, 1), date(2025, 2, 28), end_date="2025-02-02") == [date(2025, 1, 31)]
+    assert occ(app, date(2025, 2, 1), date(2025, 2, 28)) == []
+    assert occ(app, date(2025, 1, 1), date(2025, 1, 31), start_date=None) == []
+
+def test_weekly_series_starts_at_window(app):
+    assert occ(app, date(2030, 3, 1), date(2030, 3, 31), recurrence="s:2") == [date(2030, 3, 8), date(2030, 3, 22)]
+
+def test_monthly_series_clamps_to_month_end(app):
+    got = occ(app, date(2025, 1, 1), date(2025, 5, 31), recurrence="m:1")
+    assert got == [date(2025, 1, 31), date(2025, 2, 28), date(2025, 3, 31), date(2025, 4, 30), date(2025, 5, 31)]
+
+def test_series_until_and_multiday_overlap(app):
+    e = {"recurrence": "a:1:2027-06-30", "end_date": "2025-02-03"}
+    assert occ(app, date(2026, 2, 2), date(2026, 2, 10), **e) == [date(2026, 1, 31)]
+    assert occ(app, date(2028, 1, 1), date(2028, 12, 31), **e) == []
+
+def test_invalid_recurrence_is_a_single_event(app):
+    assert app["parse_recurrence"]("m:0") is None and app["parse_recurrence"]("x:2") is None
+    assert occ(app, date(2025, 1, 1), date(2026, 12, 31), recurrence="m:0") == [date(2025, 1, 31)]
@@ -0,0 +1,39 @@
+import json
+
+import pytest
+from postgrest import SyncPostgrestClient
+
+from backend import Backend, LocalBackend, LocalStore, SupabaseBackend
+
+# Filtre de delete_photo : la consultation référence-t-elle déjà cet objet ?
+PHOTO_REF = json.dumps([{"key": "public/u/abc.jpg"}])
+
+def test_contains_builds_postgrest_filter():
+    q = (SyncPostgrestClient("http://localhost").from_("consultations").select("id")
+         .eq("owner", "u").neq("id", "c2").contains("photos", PHOTO_REF).limit(1))
+    assert q.params["photos"] == "cs." + PHOTO_REF
+
+def test_contains_local_store(tmp_path):
+    s = LocalStore(tmp_path / "data.sqlite")
+    s.table("consultations").insert([
+        {"id": "c1", "owner": "u", "photos": [{"key": "public/u/abc.jpg", "thumb": "public/u/abc_t.jpg"}]},
+        {"id": "c2", "owner": "u", "photos": [{"key": "public/u/def.jpg"}]},
+    ]).execute()
+    hits = s.table("consultations").select("id").eq("owner", "u").contains("photos", PHOTO_REF).execute().data
+    assert [r["id"] for r in hits] == ["c1"]
+
+def test_incomplete_backend_fails_at_creation():
+    class NoBucket(Backend):
+        def table(self, name): ...
+        def sign_in(self, email, password): ...
+    with pytest.raises(TypeError, match="bucket"):
+        NoBucket()
+
+def test_backends_implement_interface(tmp_path):
+    local = LocalBackend(tmp_path)
+    assert local.sign_in("A@b.org ", "")["id"] == LocalBackend.user_id("a@b.org")
+    shared = SupabaseBackend("http://localhost:54321", "a.b.c", "photos")   # aucun appel réseau à la création
+    session = shared.session("sid")
+    assert session.table("patients") is not None
+    with pytest.raises(RuntimeError):
+        shared.sign_in("a@b.org", "x")
@@ -0,0 +1,31 @@
+def read(c, calls, key, owner="u", table="consultations", pids=None):
+    return c.get_or_set(key, c.version(owner, table, pids), lambda: calls.append(key) or len(calls))
+
+def test_patient_scoped_reads_survive_other_patients(app):
+    c, calls = app["VersionedCache"](), []
+    read(c, calls, "p1", pids=("p1",)); read(c, calls, "p2", pids=("p2",)); read(c, calls, "all")
+    c.bump("u", "consultations", "p1")
+    read(c, calls, "p1", pids=("p1",)); read(c, calls, "p2", pids=("p2",)); read(c, calls, "all")
+    assert calls == ["p1", "p2", "all", "p1", "all"]
+
+def test_table_wide_write_invalidates_every_scope(app):
+    c, calls = app["VersionedCache"](), []
+    read(c, calls, "p1", pids=("p1",)); read(c, calls, "all")
+    c.bump("u", "consultations")
+    c.bump("other", "consultations"); c.bump("u", "patients")   # autre owner, autre table : sans effet
+    read(c, calls, "p1", pids=("p1",)); read(c, calls, "all")
+    read(c, calls, "p1", pids=("p1",)); read(c, calls, "all")
+    assert calls == ["p1", "all", "p1", "all"]
+    assert c.stats()["hits"] == 2
+
+def test_ttl_and_lru_eviction(app, monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(app["time"], "monotonic", lambda: now[0])
+    c, calls = app["VersionedCache"](ttl=10, maxsize=2), []
+    read(c, calls, "a"); read(c, calls, "b"); read(c, calls, "a")
+    read(c, calls, "c")               # évince b, le moins récemment lu
+    read(c, calls, "a"); read(c, calls, "b")
+    assert calls == ["a", "b", "c", "b"]
+    now[0] = 11
+    read(c, calls, "b")
+    assert calls[-1] == "b" and len(calls) == 5
@@ -0,0 +1,73 @@
+import io
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+OWNER = "owner-import"
+HEADER = ["ID", "Nom du patient", "Numéro de téléphone", "Date de consultation", "Diagnostic",
+          "Prochain rendez-vous / Suivi (date)", "Priorité (Faible/Moyen/Urgent)", "Lieu (Urgences/Consultation/Bloc)"]
+ROWS = [
+    [None, "Salma Zniber", 656586597.0, "05/03/2025", "Glaucome", "2025-06-01", "Urgent", "Bloc"],
+    [42.0, "Mehdi Kettani", "0612345678", "2025-03-06", None, None, "Faible", "Cabinet"],
+    [None, None, "0600000000", "2025-03-07", None, None, None, None],                    # nom manquant
+    [None, "Inès Hajji", None, "31/02/2025", None, None, "Moyen", None],               # date invalide
+    [None, "Youssef Idrissi", None, None, None, None, "Très urgent", None],             # priorité inconnue
+]
+
+def workbook(rows=ROWS) -> bytes:
+    wb = Workbook(); ws = wb.active; ws.title = "Patients"
+    ws.append(HEADER)
+    for r in rows: ws.append(r)
+    buf = io.BytesIO(); wb.save(buf)
+    return buf.getvalue()
+
+@pytest.fixture
+def imp(app, tmp_path, monkeypatch):
+    monkeypatch.setitem(app, "IMPORT_DIR", tmp_path / "import")
+    return app
+
+def patients(app):
+    return {r["nom"]: r for r in app["be"].table("patients").select("*").eq("owner", OWNER).execute().data}
+
+def test_normalize_import(imp):
+    fields = imp["IMPORT_SHEETS"]["Patients"][1]
+    df = pd.DataFrame(ROWS, columns=[fields[h] for h in HEADER], index=range(2, 2 + len(ROWS)))
+    out, err = imp["normalize_import"](OWNER, "patients", df)
+    assert err.tolist() == ["", "", "nom manquant", "date invalide (date_consult)", "priorité inconnue"]
+    assert out.loc[2, ["telephone", "date_consult", "niveau", "lieu"]].tolist() == ["656586597", "2025-03-05", "Haute", "Bloc"]
+    assert out.loc[3, ["niveau", "lieu"]].tolist() == ["Basse", "Consultation"]
+    # Id saisi inconnu de l'owner : espacé par owner et table ; sans id : clé déterministe
+    assert out.loc[3, "id"] == imp["import_id"](OWNER, "patients", "id", "42")
+    assert out.loc[2, "id"] == imp["normalize_import"](OWNER, "patients", df)[0].loc[2, "id"]
+    assert out["owner"].eq(OWNER).all()
+
+def test_run_import_dry_run_then_write(imp):
+    raw = workbook()
+    rep = imp["run_import"](OWNER, raw, dry_run=True)
+    assert rep["rows"] == {"patients": 2, "consultations": 2} and rep["existing"]["patients"] == 0
+    assert [(e["ligne"], e["erreur"]) for e in rep["errors"]] == [(4, "nom manquant"), (5, "date invalide (date_consult)"),
+                                                                  (6, "priorité inconnue")]
+    assert patients(imp) == {}
+
+    imp["run_import"](OWNER, raw, dry_run=False)
+    pats = patients(imp)
+    assert sorted(pats) == ["Mehdi Kettani", "Salma Zniber"]
+    cons = imp["be"].table("consultations").select("*").eq("owner", OWNER).execute().data
+    assert {c["patient_id"] for c in cons} == {p["id"] for p in pats.values()}
+    salma = next(c for c in cons if c["patient_id"] == pats["Salma Zniber"]["id"])
+    assert (salma["pathologie"], salma["lieu"], salma["prochain_rdv"]) == ("Glaucome", "Bloc", "2025-06-01")
+
+    # Réimport du même classeur : mêmes ids, aucune ligne en double
+    rep = imp["run_import"](OWNER, raw, dry_run=True)
+    assert rep["existing"] == {"patients": 2, "consultations": 2}
+    imp["run_import"](OWNER, raw, dry_run=False)
+    assert patients(imp) == {n: {**p, "updated_at": patients(imp)[n]["updated_at"]} for n, p in pats.items()}
+    assert len(imp["be"].table("consultations").select("id").eq("owner", OWNER).execute().data) == 2
+
+def test_run_import_keeps_ids_of_existing_rows(imp):
+    # Classeur issu d'un export : l'id désigne déjà une fiche de l'owner et la met à jour
+    imp["be"].table("patients").insert({"id": "keep01", "owner": OWNER, "nom": "Ancien nom"}).execute()
+    imp["run_import"](OWNER, workbook([["keep01", "Nouveau nom", None, "2025-01-02", None, None, "Moyen", None]]), dry_run=False)
+    rows = imp["be"].table("patients").select("*").eq("id", "keep01").execute().data
+    assert [(r["owner"], r["nom"], r["niveau"]) for r in rows] == [(OWNER, "Nouveau nom", "Moyenne")]
@@ -0,0 +1,75 @@
+from datetime import date
+
+import pytest
+
+@pytest.fixture
+def search(app):
+    ix = app["SearchIndex"]()
+    ix.upsert("patients", {"id": "p1", "nom": "Salma Zniber", "telephone": "+212 656-586597", "tags": "glaucome",
+                           "pathologie": "Glaucome", "note": ""})
+    ix.upsert("patients", {"id": "p2", "nom": "Mehdi Kettani", "telephone": "0612345678", "tags": "",
+                           "pathologie": "Cataracte", "note": "opéré œil droit"})
+    ix.upsert("consultations", {"id": "c1", "patient_id": "p2", "pathologie": "Uvéite", "note": "contrôle"})
+    return ix
+
+def test_search_exact_prefix_and_fuzzy(search):
+    assert search.search("zniber") == ["p1"]
+    assert search.search("kett") == ["p2"]
+    assert search.search("ketani") == ["p2"]        # approché (trigrammes)
+    assert search.search("OPERE") == ["p2"]         # casse et accents ignorés
+    assert search.search("uveite") == ["p2"]        # consultation rattachée à son patient
+    assert search.search("salma cataracte") == []   # chaque mot doit correspondre
+
+def test_search_phone_variants(search):
+    for q in ("0656586597", "00212656586597", "656586597"):
+        assert search.search(q) == ["p1"], q
+
+def test_search_partial_update_and_remove(search):
+    search.upsert("patients", {"id": "p1", "tags": "urgent"}, partial=True)
+    assert search.search("urgent") == ["p1"] and search.search("zniber") == ["p1"]
+    search.upsert("consultations", {"id": "c1", "patient_id": "p1", "pathologie": "Uvéite"})
+    assert search.search("uveite") == ["p1"] and search.search("controle") == []
+    search.remove("patients", "p1")
+    assert search.search("uveite") == [] and search.search("zniber") == []
+    assert search.search("mehdi") == ["p2"]
+
+def test_match_keys(app):
+    mk = app["match_keys"]
+    assert mk("ZNIBER Salma", "") == mk("Salma Zniber", "") == mk("salma  zniber", "")
+    assert mk("Mohammed El Amrani", "") & mk("Mohamed Amrani", "")
+    # Deux prénoms en commun ne suffisent pas ; la particule « el » non plus
+    assert not mk("Fatima Zahra Bennani", "") & mk("Fatima Zahra Alaoui", "")
+    assert not {k for k in mk("Mohamed El Amrani", "") & mk("Mohamed El Fassi", "") if k[0] == "p"}
+    assert "t:656586597" in mk("x", "+212 6 56 58 65 97") & mk("y", "06.56.58.65.97")
+    assert not {k for k in mk("x", "1234") if k[0] == "t"}
+
+def test_duplicate_match_and_groups(app):
+    ix = app["DuplicateIndex"]()
+    ix.upsert("patients", {"id": "p1", "nom": "Salma Zniber", "telephone": "0656586597"})
+    ix.upsert("patients", {"id": "p2", "nom": "ZNIBER Salma", "telephone": "+212656586597"})
+    ix.upsert("patients", {"id": "p3", "nom": "Salma Zniber", "telephone": "0611111111"})   # homonyme
+    ix.upsert("patients", {"id": "p4", "nom": "Mehdi Kettani", "telephone": ""})
+    hits = ix.match("salma zniber", "0656586597")
+    assert {h[0] for h in hits[:2]} == {"p1", "p2"} and hits[0][2] == {"n", "p", "t"} and hits[2][0] == "p3"
+    assert {h[0] for h in ix.match("Salma Zniber", exclude="p1")} == {"p2", "p3"}
+    assert ix.groups() == [["p1", "p2"]]
+    ix.upsert("patients", {"id": "p2", "nom": "Salma Bennani"}, partial=True)
+    assert ix.groups() == [] and {h[0] for h in ix.match("x", "0656586597")} == {"p1", "p2"}
+    ix.remove("patients", "p1")
+    assert [h[0] for h in ix.match("Salma Zniber")] == ["p3"]
+
+def test_followup_overdue_tracks_visits(app):
+    fx = app["FollowupIndex"]()
+    fx.upsert("patients", {"id": "p1", "nom": "A", "date_consult": "2025-01-10", "prochain_rdv": "2025-03-01"})
+    fx.upsert("consultations", {"id": "c1", "patient_id": "p1", "date_consult": "2025-01-10", "prochain_rdv": "2025-03-01"})
+    fx.upsert("events", {"id": "e1", "title": "Réunion", "start_date": "2025-02-01"})
+    today = date(2025, 4, 1)
+    assert [(it["patient_id"], it["date"]) for it in fx.overdue(today)] == [("p1", "2025-03-01")]   # fiche + consultation : une fois
+    fx.upsert("consultations", {"id": "c2", "patient_id": "p1", "date_consult": "2025-03-05", "prochain_rdv": None})
+    assert fx.overdue(today) == []
+    fx.remove("consultations", "c2")
+    assert len(fx.overdue(today)) == 1
+    fx.upsert("patients", {"id": "p2", "nom": "B", "date_consult": "2025-03-20"})
+    fx.upsert("consultations", {"id": "c1", "patient_id": "p2"}, partial=True)   # fusion : c1 passe à p2
+    fx.upsert("patients", {"id": "p1", "prochain_rdv": None}, partial=True)
+    assert fx.overdue(today) == []
@@ -0,0 +1,118 @@
+import json
+import time
+
+import pytest
+
+from backend import LocalStore
+
+def item(seq, tbl, op, payload=None, rid=None):
+    filters = [["eq", "owner", "u"]] + ([["eq", "id", rid]] if rid else [])
+    return seq, tbl, op, json.dumps(filters), json.dumps(payload) if payload is not None else None
+
+def test_coalesce_merges_inserts_and_updates(app):
+    out = app["coalesce_outbox"]([
+        item(1, "patients", "insert", {"id": "p1", "nom": "A"}),
+        item(2, "patients", "insert", {"id": "p2", "nom": "B"}),
+        item(3, "patients", "update", {"nom": "A2"}, rid="p1"),
+        item(4, "consultations", "insert", {"id": "c1", "patient_id": "p1"}),
+        item(5, "patients", "update", {"tags": "x"}, rid="p2"),
+    ])
+    assert [(seqs, tbl, op) for seqs, tbl, op, _, _ in out] == [([1, 2, 3, 5], "patients", "upsert"), ([4], "consultations", "upsert")]
+    assert out[0][4] == [{"id": "p1", "nom": "A2"}, {"id": "p2", "nom": "B", "tags": "x"}]
+
+def test_coalesce_delete_drops_pending_row(app):
+    out = app["coalesce_outbox"]([
+        item(1, "patients", "insert", {"id": "p1", "nom": "A"}),
+        item(2, "patients", "insert", {"id": "p2", "nom": "B"}),
+        item(3, "patients", "delete", rid="p1"),
+        item(4, "patients", "update", {"nom": "A2"}, rid="p1"),
+    ])
+    assert [(seqs, op) for seqs, _, op, _, _ in out] == [([1, 2], "upsert"), ([3], "delete"), ([4], "update")]
+    assert out[0][4] == [{"id": "p2", "nom": "B"}]
+
+def test_coalesce_filtered_write_closes_merges(app):
+    # Un update sans id (tous les patients de l'owner) doit rester entre l'insert et l'update qui le suit
+    out = app["coalesce_outbox"]([
+        item(1, "patients", "insert", {"id": "p1", "nom": "A"}),
+        item(2, "patients", "update", {"niveau": "Haute"}),
+        item(3, "patients", "update", {"nom": "A2"}, rid="p1"),
+    ])
+    assert [(seqs, op) for seqs, _, op, _, _ in out] == [([1], "upsert"), ([2], "update"), ([3], "update")]
+
+def test_coalesce_splits_batches(app, monkeypatch):
+    monkeypatch.setitem(app, "FLUSH_BATCH", 2)
+    out = app["coalesce_outbox"]([item(i, "patients", "insert", {"id": f"p{i}"}) for i in range(1, 6)])
+    assert [len(rows) for _, _, _, _, rows in out] == [2, 2, 1]
+
+class Remote:
+    """LocalStore distant qui consigne les écritures reçues ; down=True simule une coupure réseau."""
+    def __init__(self, path):
+        self.store, self.sent, self.down = LocalStore(path), [], False
+
+    def table(self, name):
+        if self.down: raise ConnectionError("réseau indisponible")
+        q = self.store.table(name)
+        execute = q.execute
+        def traced():
+            self.sent.append((name, q.op, q.payload)); return execute()
+        q.execute = traced
+        return q
+
+@pytest.fixture
+def mirror(app, tmp_path, monkeypatch):
+    monkeypatch.setitem(app, "MIRROR_DIR", tmp_path / "mirror")
+    monkeypatch.setitem(app, "WRITE_BEHIND", True)   # écritures gardées dans l'outbox jusqu'au flush
+    return app["Mirror"]("u", Remote(tmp_path / "remote.sqlite"))
+
+def rows(store, table):
+    return {r["id"]: r for r in store.table(table).select("*").execute().data}
+
+def test_mirror_flush_sends_coalesced_outbox(mirror):
+    m = mirror
+    m.table("patients").insert({"id": "p1", "owner": "u", "nom": "A", "tags": "x"}).execute()
+    m.table("patients").insert({"id": "p2", "owner": "u", "nom": "B"}).execute()
+    m.table("patients").update({"nom": "A2"}).eq("owner", "u").eq("id", "p1").execute()
+    assert m.pending() == 3 and m.wake.is_set()
+    assert m.flush() and m.pending() == 0
+    # Un upsert par jeu de colonnes : p2 ne reçoit pas tags = NULL
+    assert sorted((t, op, len(p)) for t, op, p in m.remote.sent) == [("patients", "upsert", 1), ("patients", "upsert", 1)]
+    remote = rows(m.remote.store, "patients")
+    assert (remote["p1"]["nom"], remote["p1"]["tags"], remote["p2"]["nom"]) == ("A2", "x", "B")
+    assert "tags" not in remote["p2"]
+
+def test_mirror_flush_keeps_outbox_while_offline(mirror):
+    m = mirror
+    m.remote.down = True
+    m.table("patients").insert({"id": "p1", "owner": "u", "nom": "A"}).execute()
+    m.table("patients").delete().eq("owner", "u").eq("id", "p1").execute()
+    m.table("patients").insert({"id": "p2", "owner": "u", "nom": "B"}).execute()
+    # L'insert de p1, vidé par le delete, ne coûte aucun envoi ; le delete échoue et bloque la suite
+    assert not m.flush()
+    assert m.pending() == 2 and "réseau" in m.error
+    assert m.store.sql("SELECT op, tries FROM outbox ORDER BY seq") == [("delete", 1), ("insert", 0)]
+    m.remote.down = False
+    assert m.flush() and m.pending() == 0 and m.error is None
+    assert list(rows(m.remote.store, "patients")) == ["p2"]
+    assert [op for _, op, _ in m.remote.sent] == ["delete", "upsert"]   # p1 retiré du lot avant l'envoi
+
+def wait_for(cond, timeout=5.0):
+    end = time.time() + timeout
+    while not cond() and time.time() < end: time.sleep(.02)
+    return cond()
+
+def test_write_behind_worker_pushes_outbox(app, mirror, monkeypatch):
+    m = mirror
+    monkeypatch.setattr(app["WriteBehind"], "TICK", .05)
+    wb = app["WriteBehind"](m)
+    m.remote.down = True
+    m.table("patients").insert({"id": "p1", "owner": "u", "nom": "A"}).execute()
+    wb.ensure()
+    assert wait_for(lambda: wb.failures)
+    [f] = wb.take_failures()
+    assert "1 modification(s) en attente" in f["msg"] and m.pending() == 1
+    m.remote.down = False
+    m.failed_at = 0   # pas de répit de 5 s après l'échec
+    m.table("patients").update({"nom": "A2"}).eq("owner", "u").eq("id", "p1").execute()
+    assert wait_for(lambda: m.pending() == 0)
+    assert rows(m.remote.store, "patients")["p1"]["nom"] == "A2"
+    assert wb.take_failures() == []
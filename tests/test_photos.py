@@ -0,0 +1,51 @@
+import httpx
+import pytest
+from storage3._sync.file_api import SyncBucketProxy
+
+STORED = {"public/u/a.jpg", "public/u/b.jpg"}
+
+def storage(handler):
+    client = httpx.Client(base_url="http://storage.test/storage/v1/", transport=httpx.MockTransport(handler))
+    return SyncBucketProxy("photos", client)
+
+def storage_api(request):
+    # Comme Supabase Storage : le lot renvoie signedURL null pour un objet absent, la clé seule un 400
+    body = request.read()
+    if request.url.path == "/storage/v1/object/sign/photos":
+        paths = httpx.Response(200, content=body).json()["paths"]
+        return httpx.Response(200, json=[{"path": p, "signedURL": f"/object/sign/photos/{p}?token=t" if p in STORED else None,
+                                          "error": None if p in STORED else "Either the object does not exist or you do not have access to it"}
+                                         for p in paths])
+    path = request.url.path.removeprefix("/storage/v1/object/sign/photos/")
+    if path in STORED: return httpx.Response(200, json={"signedURL": f"/object/sign/photos/{path}?token=t"})
+    return httpx.Response(400, json={"statusCode": "404", "error": "not_found", "message": "Object not found"})
+
+def test_batch_signing_fails_on_missing_object():
+    with pytest.raises(AttributeError):
+        storage(storage_api).create_signed_urls(["public/u/a.jpg", "public/u/missing.jpg"], 60)
+
+def test_sign_many_skips_missing_objects(app, monkeypatch):
+    monkeypatch.setitem(app, "bucket", lambda: storage(storage_api))
+    urls = app["sign_many"](["public/u/a.jpg", "public/u/missing.jpg", "public/u/b.jpg"])
+    assert sorted(urls) == ["public/u/a.jpg", "public/u/b.jpg"]
+    assert urls["public/u/a.jpg"].startswith("http://storage.test/")
+
+def test_sign_many_stops_when_storage_unreachable(app, monkeypatch):
+    calls = []
+    def down(request):
+        calls.append(request); raise httpx.ConnectError("refused", request=request)
+    monkeypatch.setitem(app, "bucket", lambda: storage(down))
+    assert app["sign_many"]([f"public/u/{i}.jpg" for i in range(40)]) == {}
+    assert len(calls) <= app["UPLOAD_WORKERS"]
+
+def test_url_cache_remembers_refused_keys(app, monkeypatch):
+    calls = []
+    def api(request):
+        calls.append(request.url.path); return storage_api(request)
+    monkeypatch.setitem(app, "bucket", lambda: storage(api))
+    cache = app["SignedUrlCache"]()
+    assert list(cache.resolve(["public/u/a.jpg", "public/u/missing.jpg"])) == ["public/u/a.jpg"]
+    assert list(cache.resolve(["public/u/a.jpg", "public/u/missing.jpg"])) == ["public/u/a.jpg"]
+    assert len(calls) == 2
+    cache.forget(["public/u/missing.jpg"]); cache.resolve(["public/u/missing.jpg"])
+    assert len(calls) == 3